@@ -1,62 +1,88 @@
+"""
+This module implements oproperty, a property-like class that is designed to
+allow for easy overriding of a base class's property.  This is especially
+useful for things like mixins, where you don't necessarily know what the base
+class's type is, and thus can't simply call BaseClass.prop.__set__.  And,
+since super() doesn't proxy the __set__ function, it can be quite difficult to
+override a base class's property while still conforming to DRY.
+
+Usage:
+    class BaseClass(object):
+        @property
+        def prop(self):
+            return 1234
+
+    @property_overriding
+    class DerivedClass(object):
+        @oproperty
+        def prop(self, orig):
+            return orig() + 1
+
+
+FAQ:
+    Q: Why is this necessary?
+    A: I like mixins, conceptually, but Python makes it a bit tricky to do
+       stuff like overriding a base class's property setter without
+       explicitly knowing what that class is.  I wrote this to simplify
+       things for me.
+
+    Q: How does it work?
+    A: In short, we pretend to be a property-like object, and instead of
+       raising an error if the get/set/delete method doesn't exist, we call
+       the next implementation found in a base class.  If the method *does*
+       exist, we call it, but also pass along a pointer to the original
+       method, so our overriding method can make use of the original
+       method, if it's necessary.
+
+    Q: Are there any caveats?
+    A: Maybe.  I haven't properly tested this with things like abstract
+       base classes (though I plan on doing so), and anything else that
+       might rely on something actually being a property object.  I'm
+       thinking of making this class derive from property, but I'm not sure
+       that's necessarily a great idea.  Testing will continue :-)
+
+    Q: Do I have to accept the orig argument?
+    A: No.  If your getter, setter or deleter doesn't take an argument for
+       it, it's simply not passed.
+
+    Q: How does it know which property to override?
+    A: If you pass the 'name' argument, that's used.  Otherwise, it's the
+       name of the attribute the oproperty is assigned to in the class body.
+       If the oproperty is created elsewhere (or on Python versions before
+       3.6), the name of the first given function is used instead.
+
+    Q: Can I change the base class's property after the fact?
+    A: Not really.  The base attribute is looked up once per concrete
+       class and then cached.  For the decorated class and any subclasses
+       it already has, this happens when the class is decorated, so
+       monkey-patching a base class's property after that point won't be
+       noticed, even if the overriding property hasn't been used yet.
+
+    Q: What happens if the base class doesn't have the property?
+    A: A RuntimeError is raised the first time the property is used from a
+       class that has no base attribute with the appropriate name.  This
+       can't be checked when decorating the class, since mixins don't know
+       what they're going to be mixed into.
+
+    Q: What versions of Python does this work on?
+    A: This should work on Python 2.6+, including Python 3.
+"""
+
+import inspect
+import weakref
+from functools import partial
+
+__all__ = ['oproperty', 'property_overriding']
+
 
 class oproperty(object):
-    """
-    This class implements a property-like class that is designed to allow for
-    easy overriding of a base class's property.  This is especially useful for
-    things like mixins, where you don't necessarily know what the base class's
-    type is, and thus can't simply call BaseClass.prop.__set__.  And, since
-    super() doesn't proxy the __set__ function, it can be quite difficult to
-    override a base class's property while still conforming to DRY.
-
-    Usage:
-        class BaseClass(object):
-            @property
-            def prop(self):
-                return 1234
-
-        @property_overriding
-        class DerivedClass(object):
-            @oproperty
-            def prop(self, orig):
-                return orig() + 1
-
-
-    FAQ:
-        Q: Why is this necessary?
-        A: I like mixins, conceptually, but Python makes it a bit tricky to do
-           stuff like overriding a base class's property setter without
-           explicitly knowing what that class is.  I wrote this to simplify
-           things for me.
-
-        Q: How does it work?
-        A: In short, we pretend to be a property-like object, and instead of
-           raising an error if the get/set/delete method doesn't exist, we call
-           the next implementation found in a base class.  If the method *does*
-           exist, we call it, but also pass along a pointer to the original
-           method, so our overriding method can make use of the original
-           method, if it's necessary.
-
-        Q: Are there any caveats?
-        A: Maybe.  I haven't properly tested this with things like abstract
-           base classes (though I plan on doing so), and anything else that
-           might rely on something actually being a property object.  I'm
-           thinking of making this class derive from property, but I'm not sure
-           that's necessarily a great idea.  Testing will continue :-)
-
-        Q: What versions of Python does this work on?
-        A: This should work on Python 2.6+, including Python 3.
-
-    TODO:
-        - Unsure what I want to do to deal with the case where the base
-          property doesn't actually exist.  Options are currently:
-            - Make the orig parameter a kwarg, and only pass it if the base
-              property actually exists
-            - The orig lambda can return a None if the base prop doesn't exist
-            - Verify when the class type is set that there is an attribute
-              with the appropriate name somewhere in the __mro__.  This would
-              throw a RuntimeError(?) if we then try and override a property
-              that doesn't already exist.
-    """
+    # Note that the documentation for this class lives in the module
+    # docstring, since we store each instance's __doc__ in a slot, and a class
+    # can't have both a docstring and a '__doc__' slot.
+    __slots__ = ('fget', 'fset', 'fdel', '__doc__', '_prop_name',
+                 '_name_fixed', '__class_type', '_super_attr_cache',
+                 '_class_refs', '_fget_wants_orig', '_fset_wants_orig',
+                 '_fdel_wants_orig', '__weakref__')
 
     def __init__(self, fget=None, fset=None, fdel=None, doc=None, name=None):
         self.fget = fget
@@ -64,57 +90,102 @@ class oproperty(object):
         self.fdel = fdel
         self.__doc__ = doc
 
+        # Figure out which of our functions need to be given the orig
+        # function, so we don't have to on every call.
+        self._fget_wants_orig = fget is not None and _accepts_orig(fget, 1)
+        self._fset_wants_orig = fset is not None and _accepts_orig(fset, 2)
+        self._fdel_wants_orig = fdel is not None and _accepts_orig(fdel, 1)
+
         # If we're not explicitly given a name to override, we try and
         # determine it by inspecting the names of any given functions.  If we
         # can't do this, we raise an error, since we don't know what to
-        # override at all.
+        # override at all.  Note that if we're created in a class body, this
+        # is replaced by the attribute name in __set_name__, below.
+        self._name_fixed = name is not None
         if name is None:
-            if fget is not None:
-                name = fget.__name__
-            elif fset is not None:
-                name = fset.__name__
-            elif fdel is not None:
-                name = fdel.__name__
+            for func in (fget, fset, fdel):
+                if func is not None:
+                    name = func.__name__
+                    break
             else:
                 raise RuntimeError("Can't create a property with no functions!")
 
         self._prop_name = name
         self.__class_type = None
 
-    def __get__(self, obj, type=None):
+        # Maps the id() of each concrete class we're accessed through to the
+        # base attribute that we're overriding in that class.  This is a plain
+        # dict rather than a WeakKeyDictionary, since every lookup in the
+        # latter goes through a Python-level __getitem__.  Instead, we keep a
+        # weak reference to each class that drops its entry when it goes away.
+        self._super_attr_cache = {}
+        self._class_refs = {}
+
+    def __set_name__(self, owner, name):
+        # Python 3.6+ calls this with the name we're assigned to in the class
+        # body, which is what we should be overriding unless we were
+        # explicitly told otherwise.  If we're aliased in the class body
+        # (e.g. 'alias = prop'), this is called again for each alias, so we
+        # only use the first name we're given.
+        if not self._name_fixed:
+            self._prop_name = name
+            self._name_fixed = True
+
+    def __get__(self, obj, objtype=None):
         # If we have no object, return ourself.
         if obj is None:
             return self
 
-        # Get the superclass's attribute.
-        super_attr = self._get_super_attribute(obj, self._prop_name)
+        # Get the superclass's attribute, walking the MRO only if we haven't
+        # seen this class before.
+        try:
+            super_attr = self._super_attr_cache[id(type(obj))]
+        except KeyError:
+            super_attr = self._get_super_attribute(obj, self._prop_name)
 
         # If we have an attribute, call and return it.  Otherwise, we simply
         # call the base property's __get__ function.
-        if self.fget is not None:
-            return self.fget(obj, lambda: super_attr.__get__(obj))
+        fget = self.fget
+        if fget is not None:
+            if self._fget_wants_orig:
+                return fget(obj, partial(super_attr.__get__, obj))
+            return fget(obj)
         else:
             return super_attr.__get__(obj)
 
     def __set__(self, obj, value):
-        # Get the superclass's attribute.
-        super_attr = self._get_super_attribute(obj, self._prop_name)
+        # Get the superclass's attribute, walking the MRO only if we haven't
+        # seen this class before.
+        try:
+            super_attr = self._super_attr_cache[id(type(obj))]
+        except KeyError:
+            super_attr = self._get_super_attribute(obj, self._prop_name)
 
         # If we have an attribute, call and return it.  Otherwise, we simply
         # call the base property's __set__ function.
-        if self.fset is not None:
-            return self.fset(obj, value, lambda val: super_attr.__set__(obj, val))
+        fset = self.fset
+        if fset is not None:
+            if self._fset_wants_orig:
+                return fset(obj, value, partial(super_attr.__set__, obj))
+            return fset(obj, value)
         else:
             return super_attr.__set__(obj, value)
 
     def __delete__(self, obj):
-        # Get the superclass's attribute.
-        super_attr = self._get_super_attribute(obj, self._prop_name)
+        # Get the superclass's attribute, walking the MRO only if we haven't
+        # seen this class before.
+        try:
+            super_attr = self._super_attr_cache[id(type(obj))]
+        except KeyError:
+            super_attr = self._get_super_attribute(obj, self._prop_name)
 
         # If we have an attribute, call and return it.  Otherwise, we simply
         # call the base property's __delete__ function.
-        if self.fdel is not None:
-            return self.fdel(obj, lambda: super_attr.__delete__(obj))
+        fdel = self.fdel
+        if fdel is not None:
+            if self._fdel_wants_orig:
+                return fdel(obj, partial(super_attr.__delete__, obj))
+            return fdel(obj)
         else:
             return super_attr.__delete__(obj)
 
@@ -124,6 +195,24 @@ class oproperty(object):
         where to start searching in the __mro__ list.
         """
         self.__class_type = klass
+        self._super_attr_cache.clear()
+        self._class_refs.clear()
+
+        # Resolve the attribute we override for the decorated class and any
+        # subclasses it already has right away.  If it's not found (e.g. for
+        # a mixin), or the class is subclassed later, we'll look it up on
+        # first access from whatever concrete class we're used in.
+        name = self._prop_name
+        pending = [klass]
+        while pending:
+            cls = pending.pop()
+            base = self._find_base_class(cls, name)
+            if base is not None:
+                self._cache_super_attribute(cls, base.__dict__[name])
+
+            # We call this through type, since for a metaclass,
+            # cls.__subclasses__ would be the unbound type.__subclasses__.
+            pending.extend(type.__subclasses__(cls))
 
     def _handle_undecorated(self, an_object, mro):
         # We walk the MRO chain looking for ourself in the attributes
@@ -154,44 +243,85 @@ class oproperty(object):
                 "been decorated with property_overriding.".format(an_object)
             )
 
-    def _get_super_attribute(self, obj, name):
-        # Handle the None case.
-        if obj is None:
-            return None
+    def _find_base_class(self, cls, name):
+        # Returns the first class after the decorated class in cls's MRO that
+        # has an attribute with the given name, or None if there isn't one.
+        mro = cls.__mro__
 
-        # Get the MRO for the object
-        if isinstance(obj, type):
-            mro = obj.__mro__
+        # Find this class in the MRO.  Usually, we're being accessed through
+        # an instance of the decorated class itself, in which case it's first.
+        if mro[0] is self.__class_type:
+            pos = 0
         else:
-            mro = obj.__class__.__mro__
-
-        if self.__class_type is None:
-            self._handle_undecorated(obj, mro)
-
-        # Find this class in the MRO.
-        for pos in range(len(mro)):
-            if mro[pos] == self.__class_type:
-                break
+            try:
+                pos = mro.index(self.__class_type)
+            except ValueError:
+                raise RuntimeError(
+                    "'{0}' doesn't inherit from '{1}', which this property " \
+                    "belongs to".format(cls.__name__,
+                                        self.__class_type.__name__)
+                )
 
         # Look through classes higher in the MRO for this attribute.
         for pos in range(pos + 1, len(mro)):
-            tmp = mro[pos]
-
-            if isinstance(tmp, type) and name in tmp.__dict__:
-                return tmp.__dict__[name]
+            # Everything in an MRO is a class, so we can use its __dict__
+            # directly.
+            if name in mro[pos].__dict__:
+                return mro[pos]
 
         return None
 
+    def _cache_super_attribute(self, cls, super_attr):
+        key = id(cls)
+        cache = self._super_attr_cache
+        refs = self._class_refs
+
+        # The callback only holds on to our dicts, not the class, so it won't
+        # keep the class alive.  It runs before the class's memory is freed,
+        # so its id() can't be reused while the entry is still around.
+        def forget(ref):
+            cache.pop(key, None)
+            refs.pop(key, None)
+
+        refs[key] = weakref.ref(cls, forget)
+        cache[key] = super_attr
+
+    def _get_super_attribute(self, obj, name):
+        # This is only called when the attribute for the class we're being
+        # accessed through isn't cached yet, so we walk the MRO and cache it.
+        cls = type(obj)
+
+        if self.__class_type is None:
+            self._handle_undecorated(obj, cls.__mro__)
+
+        base = self._find_base_class(cls, name)
+        if base is not None:
+            super_attr = base.__dict__[name]
+            self._cache_super_attribute(cls, super_attr)
+            return super_attr
+
+        # We can't tell at decoration time whether the base attribute exists,
+        # since a mixin's own MRO won't contain it, so we check here instead.
+        raise RuntimeError(
+            "'{0}' has no base attribute {1!r} to override".format(
+                cls.__name__, name)
+        )
+
+    # Whenever one of our functions is set, we also figure out whether it
+    # needs to be given the orig function, so we don't have to on every call.
     def getter(self, fget):
         self.fget = fget
+        self._fget_wants_orig = fget is not None and _accepts_orig(fget, 1)
         return self
 
     def setter(self, fset):
         self.fset = fset
+        self._fset_wants_orig = fset is not None and _accepts_orig(fset, 2)
         return self
 
     def deleter(self, fdel):
         self.fdel = fdel
+        self._fdel_wants_orig = fdel is not None and _accepts_orig(fdel, 1)
         return self
 
     @classmethod
@@ -221,9 +351,26 @@ class oproperty(object):
         return klass(fdel=fdel, **kwargs)
 
 
+def _accepts_orig(func, nargs):
+    # Returns whether the given function takes an orig argument after its
+    # first nargs positional arguments.  If we can't tell (e.g. for builtins
+    # or other callables), we assume it does.
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return True
+
+    if code.co_flags & inspect.CO_VARARGS:
+        return True
+
+    # Bound methods already have their first argument filled in.
+    if getattr(func, '__self__', None) is not None:
+        nargs += 1
+
+    return code.co_argcount > nargs
+
 
 def property_overriding(klass):
-    for name, val in klass.__dict__.items():
+    for val in klass.__dict__.values():
         if isinstance(val, oproperty):
             val.set_class_type(klass)
 
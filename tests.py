@@ -1,4 +1,6 @@
+import gc
 import unittest
+import weakref
 from testing_helpers import BaseTestCase
 from oproperty import *
 
@@ -51,7 +53,7 @@ class TestBasicImplementation(BaseTestCase):
 
 
 class TestNamings(BaseTestCase):
-    def build_class(self, **kwargs):
+    def build_base(self):
         class BaseClass(object):
             @property
             def prop1(self):
@@ -61,36 +63,66 @@ class TestNamings(BaseTestCase):
             def prop2(self):
                 return 456
 
+        return BaseClass
+
+    def build_class(self, **kwargs):
         @property_overriding
-        class DerivedClass(BaseClass):
-            prop = oproperty(**kwargs)
+        class DerivedClass(self.build_base()):
+            prop1 = oproperty(**kwargs)
 
         return DerivedClass()
 
     def test_fget_name(self):
-        def prop1(self, orig):
+        def prop2(self, orig):
             return orig()
 
-        o = self.build_class(fget=prop1)
-        self.assert_equal(o.prop, 123)
+        o = self.build_class(fget=prop2)
+        self.assert_equal(o.prop1, 123)
 
     def test_fset_name(self):
-        def prop1(): pass
-        o = self.build_class(fset=prop1)
-        self.assert_equal(o.prop, 123)
+        def prop2(): pass
+        o = self.build_class(fset=prop2)
+        self.assert_equal(o.prop1, 123)
 
     def test_fdel_name(self):
-        def prop1(): pass
-        o = self.build_class(fdel=prop1)
-        self.assert_equal(o.prop, 123)
+        def prop2(): pass
+        o = self.build_class(fdel=prop2)
+        self.assert_equal(o.prop1, 123)
 
     def test_name_override(self):
         def not_a_prop(self, orig):
             return orig()
 
         o = self.build_class(name='prop2')
+        self.assert_equal(o.prop1, 456)
+
+    def test_function_name_outside_class_body(self):
+        def prop2(self, orig):
+            return orig()
+
+        class DerivedClass(self.build_base()):
+            pass
+
+        # Assigning after the class is created doesn't call __set_name__.
+        DerivedClass.prop = oproperty(fget=prop2)
+        property_overriding(DerivedClass)
+
+        o = DerivedClass()
         self.assert_equal(o.prop, 456)
 
+    def test_aliased(self):
+        @property_overriding
+        class DerivedClass(self.build_base()):
+            @oproperty
+            def prop1(self, orig):
+                return orig() + 1
+
+            alias = prop1
+
+        o = DerivedClass()
+        self.assert_equal(o.prop1, 123 + 1)
+        self.assert_equal(o.alias, 123 + 1)
+
     def test_fails_if_no_name(self):
         with self.assert_raises(RuntimeError):
             o = self.build_class()
@@ -158,9 +190,114 @@ class TestMiscellaneous(BaseTestCase):
         d2 = Derived2()
         self.assert_equal(d2.prop, 123 + 1)
 
-    def test_readonly(self):
+    def test_decorated_after_subclassing(self):
+        class Base(object):
+            @property
+            def prop(self):
+                return 123
+
+        class Derived1(Base):
+            @oproperty
+            def prop(self, orig):
+                return orig() + 1
+
+        class Derived2(Derived1):
+            pass
+
+        property_overriding(Derived1)
+
+        # Existing subclasses are resolved when decorating, so (as the FAQ
+        # says) patching the base afterwards isn't noticed.
+        Base.prop = property(lambda self: 456)
+
+        d2 = Derived2()
+        self.assert_equal(d2.prop, 123 + 1)
+
+    def test_on_metaclass(self):
+        class BaseMeta(type):
+            @property
+            def prop(cls):
+                return 123
+
+        @property_overriding
+        class DerivedMeta(BaseMeta):
+            @oproperty
+            def prop(cls, orig):
+                return orig() + 1
+
+        Klass = DerivedMeta('Klass', (object,), {})
+        self.assert_equal(Klass.prop, 123 + 1)
+
+    def test_subclasses_can_be_collected(self):
+        @property_overriding
+        class Derived1(BaseClass):
+            @oproperty
+            def prop(self, orig):
+                return orig() + 1
+
+        class Derived2(Derived1):
+            pass
+
+        d2 = Derived2()
+        self.assert_equal(d2.prop, 123 + 1)
+
+        ref = weakref.ref(Derived2)
+        del d2, Derived2
+        gc.collect()
+        self.assert_true(ref() is None)
+
+    def test_without_orig(self):
+        @property_overriding
+        class Derived(BaseClass):
+            @oproperty
+            def prop(self):
+                return 999
+
+            @prop.setter
+            def prop(self, val):
+                self.val = val * 2
+
+            @prop.deleter
+            def prop(self):
+                self.val = -1
+
+        d = Derived()
+        self.assert_equal(d.prop, 999)
+
+        d.prop = 5
+        self.assert_equal(d.val, 10)
+
+        del d.prop
+        self.assert_equal(d.val, -1)
+
+    def test_functions_replaced_after_decoration(self):
         @property_overriding
         class Derived(BaseClass):
+            @oproperty
+            def prop(self):
+                return 999
+
+            @prop.setter
+            def prop(self, val):
+                self.val = val * 2
+
+        def new_setter(self, val, orig):
+            orig(val + 1)
+
+        Derived.prop.setter(new_setter)
+
+        d = Derived()
+        d.prop = 5
+        self.assert_equal(d.val, 6)
+
+    def test_readonly(self):
+        class ReadOnlyBase(object):
+            @property
+            def readonly(self):
+                return 123
+
+        @property_overriding
+        class Derived(ReadOnlyBase):
             @oproperty
             def readonly(self, orig):
                 return orig() + 1
@@ -203,20 +340,41 @@ class TestMiscellaneous(BaseTestCase):
         del d2.prop
         self.assert_equal(d2.prop, 99)
 
-    # NOTE: This fails, since I haven't decided what to do in this case yet.
-    # def test_with_no_base(self):
-    #     class BaseClass(object):
-    #         pass
-    #
-    #     @property_overriding
-    #     class Derived(BaseClass):
-    #         @oproperty
-    #         def prop(self, orig):
-    #             print(repr(orig))
-    #             return orig() + 1
-    #
-    #     d = Derived()
-    #     print(d.prop)
+    def test_classmethods_need_a_function(self):
+        with self.assert_raises(RuntimeError):
+            oproperty.override_setter(None)
+
+        with self.assert_raises(RuntimeError):
+            oproperty.override_deleter(None)
+
+    def test_no_instance_dict(self):
+        def prop(self, orig):
+            return orig()
+
+        p = oproperty(prop, doc='Some docs')
+        self.assert_false(hasattr(p, '__dict__'))
+        self.assert_equal(p.__doc__, 'Some docs')
+
+        with self.assert_raises(AttributeError):
+            p.some_attribute = 1
+
+        # We should still be weak-referenceable, like property is.
+        ref = weakref.ref(p)
+        self.assert_true(ref() is p)
+
+    def test_with_no_base(self):
+        class BaseClass(object):
+            pass
+
+        @property_overriding
+        class Derived(BaseClass):
+            @oproperty
+            def prop(self, orig):
+                return orig() + 1
+
+        d = Derived()
+        with self.assert_raises(RuntimeError):
+            v = d.prop
 
 
 def suite():